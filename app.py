@@ -1,25 +1,30 @@
 from datetime import datetime
 from pathlib import Path
 import json
+import orjson
 import streamlit as st
 import subprocess
 import sys
 import os
 
-from prompt_service import generate_prompt, generate_prompt_from_desc_and_image 
+from prompt_service import generate_prompt_cached, generate_prompts_parallel, stream_prompt, warm_up_model, unload_models
 from ui import shot_description_input, show_existing_prompt, shot_action_buttons, show_generated_output, shot_reference_image_controls 
 
 
 from config import ensure_roots, init_session_state, ROOT_SCENES, ROOT_PROMPTS
-from storage import ensure_scene_dirs, save_json, append_jsonl, load_json
+from storage import ensure_scene_dirs, save_json, append_jsonl_many, load_json
 from export_service import create_export_zip
+from video_service import ffmpeg_caps, best_hw_encoder, has_audio_stream, concat_filter_cmd, clips_share_params, concat_list_line, reencode_cmd, list_videos
 from ui_sidebar import render_sidebar
 from text_utils import ensure_suffix, enforce_word_budget
 import time
-from typing import Dict, Any
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 
 import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # System prompt sent to llama
 DEFAULT_SYSTEM = (
@@ -30,6 +35,250 @@ DEFAULT_SYSTEM = (
     "quotes. Use present tense, and British English."
 )
 
+# Saves the uploaded reference image for a shot and returns its path
+def _save_shot_reference(ref_file, scene_idx: int, shot_idx: int) -> Path:
+    sid = st.session_state.get("session_timestamp", "session_default")
+    save_dir = ROOT_PROMPTS / sid / "shot_refs" / f"scene_{scene_idx}_shot_{shot_idx}"
+    save_dir.mkdir(parents=True, exist_ok=True)
+    ext = Path(ref_file.name).suffix or ".png"
+    ref_image_path = save_dir / f"reference{ext}"
+    ref_file.seek(0)
+    with open(ref_image_path, "wb") as f:
+        shutil.copyfileobj(ref_file, f, length=1 << 20)
+    return ref_image_path
+
+# Keyword arguments for generate_prompt_cached for one shot
+def _prompt_job(settings: Dict[str, Any], shot_desc: str, ref_file=None, ref_image_path: Optional[Path] = None, ref_entity: str = "") -> Dict[str, Any]:
+    job = {
+        # Text-only shots go to the lighter text model, reference-image shots to the vision model
+        "model": settings["model_name"] if ref_image_path else settings["text_only_model"],
+        "system_msg": settings["system_prompt"],
+        "shot_desc": shot_desc,
+        "temperature": settings["temperature"],
+        "num_predict": settings["num_predict"],
+    }
+    if ref_image_path:
+        job.update({
+            "image_path": str(ref_image_path),
+            "image_hash": hashlib.sha1(ref_file.getbuffer()).hexdigest(),
+            "max_words": int(settings.get("max_words", 80)),
+            "entity_hint": ref_entity or "",
+        })
+    return job
+
+# Applies the style suffix and word budget, returns (prompt, applied, trimmed)
+def _finalise_prompt(prompt_text: str, settings: Dict[str, Any]) -> Tuple[str, bool, bool]:
+    applied = False
+    if settings.get("enable_suffix"):
+        prompt_text, applied = ensure_suffix(prompt_text, settings.get("suffix_text", ""))
+    trimmed = False
+    # protects style suffix is prompt is too long
+    if settings.get("max_words"):
+        prompt_text, trimmed = enforce_word_budget(
+            prompt_text, int(settings.get("max_words")), protect_suffix=(settings.get("suffix_text") if settings.get("enable_suffix") else None)
+        )
+    return prompt_text, applied, trimmed
+
+# Records everything about one generated shot
+def _build_record(scene_idx: int, shot_idx: int, shot_desc: str, prompt_text: str, settings: Dict[str, Any], *,
+                  model: str, applied: bool, trimmed: bool, ref_image_path: Optional[Path], ref_entity: str,
+                  raw_txt_path: Path, json_path: Path, master_file: Path) -> Dict[str, Any]:
+    return {
+        "scene": scene_idx,
+        "shot": shot_idx,
+        "input_description": shot_desc.strip(),
+        "generated_prompt": prompt_text,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "model": model,
+        "options": {"temperature": settings["temperature"], "num_predict": settings["num_predict"]},
+        "style_suffix": {"enabled": bool(settings.get("enable_suffix")), "applied": bool(applied)},
+        "length_control": {"max_words": int(settings.get("max_words", 0)), "trimmed": bool(trimmed)},
+        "reference": {
+            "image": str(ref_image_path) if ref_image_path else None,
+            "entity": ref_entity or None,
+        },
+        "paths": {"raw": str(raw_txt_path), "json": str(json_path), "master": str(master_file)},
+    }
+
+# Generates every shot that has a description, sending the LLM calls concurrently
+def _generate_all_shots(settings: Dict[str, Any], master_file: Path, pending_jsonl: List[Dict[str, Any]]) -> None:
+    shots = []
+    jobs = []
+    for scene_idx in range(1, int(settings["scenes_count"]) + 1):
+        scene_dir, prompt_dir = ensure_scene_dirs(scene_idx)
+        for shot_idx in range(1, int(settings["shots_per_scene"][scene_idx]) + 1):
+            shot_desc = (st.session_state.get(f"desc_{scene_idx}_{shot_idx}") or "").strip()
+            raw_txt_path = scene_dir / f"shot_{shot_idx}.txt"
+            json_path = prompt_dir / f"shot_{shot_idx}.json"
+            if not shot_desc or (json_path.exists() and not settings["overwrite_ok"]):
+                continue
+            use_ref = bool(st.session_state.get(f"use_ref_{scene_idx}_{shot_idx}"))
+            ref_file = st.session_state.get(f"refimg_{scene_idx}_{shot_idx}")
+            ref_entity = (st.session_state.get(f"refimg_entity_{scene_idx}_{shot_idx}") or "") if use_ref else ""
+            ref_image_path = None
+            if use_ref and ref_file is not None:
+                try:
+                    ref_image_path = _save_shot_reference(ref_file, scene_idx, shot_idx)
+                except Exception as e:
+                    st.warning(f"Scene {scene_idx} shot {shot_idx}: could not save reference image. Proceeding without it. ({e})")
+            try:
+                raw_txt_path.write_text(shot_desc + "\n", encoding="utf-8")
+            except Exception as e:
+                st.error(f"Failed to write raw description: {e}")
+                continue
+            shots.append((scene_idx, shot_idx, shot_desc, ref_image_path, ref_entity, raw_txt_path, json_path))
+            jobs.append(_prompt_job(settings, shot_desc, ref_file, ref_image_path, ref_entity))
+
+    if not jobs:
+        st.info("No shots to generate. Enter descriptions, or enable 'Overwrite existing prompts' to regenerate.")
+        return
+
+    with st.spinner(f"Generating {len(jobs)} prompt(s)…"):
+        results = generate_prompts_parallel(jobs, keep_alive=settings["keep_alive"])
+
+    records = []
+    for (scene_idx, shot_idx, shot_desc, ref_image_path, ref_entity, raw_txt_path, json_path), job, (prompt_text, error) in zip(shots, jobs, results):
+        if error:
+            st.error(f"Scene {scene_idx} shot {shot_idx}: {error}")
+            continue
+        prompt_text, applied, trimmed = _finalise_prompt(prompt_text, settings)
+        records.append((json_path, _build_record(scene_idx, shot_idx, shot_desc, prompt_text, settings,
+                               model=job["model"], applied=applied, trimmed=trimmed, ref_image_path=ref_image_path, ref_entity=ref_entity,
+                               raw_txt_path=raw_txt_path, json_path=json_path, master_file=master_file)))
+
+    # Per-shot JSON files are independent, so write them concurrently; the master JSONL gets them in one append later
+    done = 0
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        futures = [(ex.submit(save_json, json_path, record), record) for json_path, record in records]
+        # Collected in submission order so the master JSONL keeps scene/shot order
+        for fut, record in futures:
+            try:
+                fut.result()
+            except Exception as e:
+                st.error(f"Failed to save outputs: {e}")
+                continue
+            pending_jsonl.append(record)
+            done += 1
+    if done:
+        st.success(f"Generated and saved {done} prompt(s).")
+
+# Master JSONL bytes and parsed (line number, record) pairs, re-read only when the file changes
+def _master_contents(master_file: Path) -> Tuple[bytes, List[Tuple[int, Dict[str, Any]]]]:
+    stat = master_file.stat()
+    stamp = (str(master_file), stat.st_mtime_ns, stat.st_size)
+    if st.session_state.get("_mf_stamp") != stamp:
+        data = master_file.read_bytes()
+        records = []
+        for ln, raw in enumerate(data.splitlines(), 1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                records.append((ln, orjson.loads(raw)))
+            except Exception:
+                continue
+        st.session_state["_mf_contents"] = (data, records)
+        st.session_state["_mf_stamp"] = stamp
+    return st.session_state["_mf_contents"]
+
+# Renders one scene's shots
+def _render_scene(scene_idx: int, settings: Dict[str, Any], master_file: Path) -> None:
+    pending_jsonl = st.session_state.setdefault("_pending_jsonl", [])
+    st.subheader(f"Scene {scene_idx}")
+    scene_dir, prompt_dir = ensure_scene_dirs(scene_idx)
+
+    for shot_idx in range(1, int(settings["shots_per_scene"][scene_idx]) + 1):
+        st.markdown(f"**Shot {shot_idx}**")
+        shot_desc = shot_description_input(scene_idx, shot_idx) # Text box for user inputting prompt per shot per scene
+        use_ref, ref_file, ref_entity = shot_reference_image_controls(scene_idx, shot_idx) 
+
+        # Two file paths for saving outputs
+        raw_txt_path = scene_dir / f"shot_{shot_idx}.txt"
+        json_path = prompt_dir / f"shot_{shot_idx}.json"
+
+        # In case of propmt existing, find and display it
+        existing = load_json(json_path)
+        show_existing_prompt(existing, scene_idx, shot_idx)
+
+        # Show raw shot text
+        gen_clicked, show_raw = shot_action_buttons(scene_idx, shot_idx)
+        if show_raw:
+            st.code(shot_desc or "(empty)")
+
+        if gen_clicked:
+            # Back up in case no text is entered when pressing 'Generate'
+            if not shot_desc or not shot_desc.strip():
+                st.warning("Please enter a description before generating.")
+                st.stop()
+            # Back up if prompt has already been genereated. Instructions for how to override
+            if json_path.exists() and not settings["overwrite_ok"]:
+                st.info("A prompt already exists for this shot. Enable 'Overwrite existing prompts' in the sidebar to regenerate.")
+                st.stop()
+            else:
+                try:
+                    raw_txt_path.write_text(shot_desc.strip() + "\n", encoding="utf-8")
+                except Exception as e:
+                    st.error(f"Failed to write raw description: {e}")
+                    st.stop()
+
+            try:
+                # If user provided a reference image, save it and use the vision flow
+                ref_image_path = None
+                if use_ref and ref_file is not None:
+                    try:
+                        ref_image_path = _save_shot_reference(ref_file, scene_idx, shot_idx)
+                    except Exception as e:
+                        st.warning(f"Could not save reference image. Proceeding without it. ({e})")
+                        ref_image_path = None
+
+                # Cached on all inputs, so regenerating with unchanged settings is instant
+                job = _prompt_job(settings, shot_desc, ref_file, ref_image_path, ref_entity)
+                if ref_image_path:
+                    prompt_text = generate_prompt_cached(**job, _keep_alive=settings["keep_alive"])
+                else:
+                    # Text-only shots stream tokens live; the session cache keeps regenerates instant
+                    stream_cache = st.session_state.setdefault("_stream_cache", {})
+                    job_key = json.dumps(job, sort_keys=True)
+                    prompt_text = stream_cache.get(job_key)
+                    if prompt_text is None:
+                        prompt_text = (st.write_stream(stream_prompt(**job, keep_alive=settings["keep_alive"])) or "").strip()
+                        if not prompt_text:
+                            raise RuntimeError("Model returned empty content.")
+                        stream_cache[job_key] = prompt_text
+            except RuntimeError as e:
+                st.error(str(e))
+                st.stop()
+
+            # Apply style suffix to end, protecting it if the prompt is too long
+            prompt_text, applied, trimmed = _finalise_prompt(prompt_text, settings)
+
+            # Records everything
+            record = _build_record(scene_idx, shot_idx, shot_desc, prompt_text, settings,
+                                   model=job["model"], applied=applied, trimmed=trimmed, ref_image_path=ref_image_path, ref_entity=ref_entity,
+                                   raw_txt_path=raw_txt_path, json_path=json_path, master_file=master_file)
+
+            # Write the JSON file and queue it for the master JSONL
+            try:
+                save_json(json_path, record)
+                pending_jsonl.append(record)
+            except Exception as e:
+                st.error(f"Failed to save outputs: {e}")
+                st.stop()
+
+            # Confidence check
+            st.success("Prompt generated and saved.")
+            show_generated_output(prompt_text, scene_idx, shot_idx)
+
+    # Stick this scene's new records on the master JSONL in one write
+    if pending_jsonl:
+        try:
+            append_jsonl_many(master_file, pending_jsonl)
+            pending_jsonl.clear()
+        except Exception as e:
+            st.error(f"Failed to save outputs: {e}")
+
+    st.divider()
+
 # Entry log to build and run UI
 def main() -> None:
     ensure_roots() # Locates root folders
@@ -61,141 +310,35 @@ def main() -> None:
         st.session_state.clear()
         st.rerun()
 
+    # Load the starting models in the background on the session's first run, so the first Generate
+    # of each kind is warm. Only once: browsing the model presets must not load every model it passes.
+    if not st.session_state.get("_models_warmed"):
+        st.session_state["_models_warmed"] = True
+        if settings["keep_alive"] != "0s":
+            for model in {settings["model_name"], settings["text_only_model"]}:
+                threading.Thread(target=warm_up_model, args=(model,), kwargs={"keep_alive": settings["keep_alive"]}, daemon=True).start()
+
     # Reads default from settings  
     scenes_count = settings["scenes_count"]
-    shots_per_scene = settings["shots_per_scene"]
-
-    # Makes/finds folders for scenes and prompts
-    for scene_idx in range(1, int(scenes_count) + 1):
-        st.subheader(f"Scene {scene_idx}")
-        scene_dir, prompt_dir = ensure_scene_dirs(scene_idx)
-
-        for shot_idx in range(1, int(shots_per_scene[scene_idx]) + 1):
-            st.markdown(f"**Shot {shot_idx}**")
-            shot_desc = shot_description_input(scene_idx, shot_idx) # Text box for user inputting prompt per shot per scene
-            use_ref, ref_file, ref_entity = shot_reference_image_controls(scene_idx, shot_idx) 
-
-            # Two file paths for saving outputs
-            raw_txt_path = scene_dir / f"shot_{shot_idx}.txt"
-            json_path = prompt_dir / f"shot_{shot_idx}.json"
-
-            # In case of propmt existing, find and display it
-            existing = load_json(json_path)
-            show_existing_prompt(existing, scene_idx, shot_idx)
-
-            # Show raw shot text
-            gen_clicked, show_raw = shot_action_buttons(scene_idx, shot_idx)
-            if show_raw:
-                st.code(shot_desc or "(empty)")
 
-            if gen_clicked:
-                # Back up in case no text is entered when pressing 'Generate'
-                if not shot_desc or not shot_desc.strip():
-                    st.warning("Please enter a description before generating.")
-                    st.stop()
-                # Back up if prompt has already been genereated. Instructions for how to override
-                if json_path.exists() and not settings["overwrite_ok"]:
-                    st.info("A prompt already exists for this shot. Enable 'Overwrite existing prompts' in the sidebar to regenerate.")
-                    st.stop()
-                else:
-                    try:
-                        raw_txt_path.write_text(shot_desc.strip() + "\n", encoding="utf-8")
-                    except Exception as e:
-                        st.error(f"Failed to write raw description: {e}")
-                        st.stop()
-
-                try:
-                    # If user provided a reference image, save it and use the vision flow
-                    ref_image_path = None
-                    if use_ref and ref_file is not None:
-                        try:
-                            sid = st.session_state.get("session_timestamp", "session_default")
-                            save_dir = ROOT_PROMPTS / sid / "shot_refs" / f"scene_{scene_idx}_shot_{shot_idx}"
-                            save_dir.mkdir(parents=True, exist_ok=True)
-                            ext = Path(ref_file.name).suffix or ".png"
-                            ref_image_path = save_dir / f"reference{ext}"
-                            with open(ref_image_path, "wb") as f:
-                                f.write(ref_file.getbuffer())
-                        except Exception as e:
-                            st.warning(f"Could not save reference image. Proceeding without it. ({e})")
-                            ref_image_path = None
-
-                    if ref_image_path:
-                        # use the same model_name (llama3.2-vision:11b) or expose a separate setting if you prefer
-                        prompt_text = generate_prompt_from_desc_and_image(
-                            model=settings["model_name"],
-                            system_msg=settings["system_prompt"],
-                            shot_desc=shot_desc,
-                            image_path=str(ref_image_path),
-                            temperature=settings["temperature"],
-                            num_predict=settings["num_predict"],
-                            max_words=int(settings.get("max_words", 80)),
-                            entity_hint=ref_entity,
-                        )
-                    else:
-                        # Text-only fallback
-                        prompt_text = generate_prompt(
-                            model=settings["model_name"],
-                            system_msg=settings["system_prompt"],
-                            shot_desc=shot_desc,
-                            temperature=settings["temperature"],
-                            num_predict=settings["num_predict"],
-                        )
-                except RuntimeError as e:
-                    st.error(str(e))
-                    st.stop()
-
-                # Apply style suffix to end
-                applied = False
-                if settings.get("enable_suffix"):
-                    prompt_text, applied = ensure_suffix(prompt_text, settings.get("suffix_text", ""))
-                trimmed = False
-                # protects style suffix is prompt is too long
-                if settings.get("max_words"):
-                    prompt_text, trimmed = enforce_word_budget(
-                        prompt_text, int(settings.get("max_words")), protect_suffix=(settings.get("suffix_text") if settings.get("enable_suffix") else None)
-                    )
-
-                # Records everything
-                record = {
-                    "scene": scene_idx,
-                    "shot": shot_idx,
-                    "input_description": shot_desc.strip(),
-                    "generated_prompt": prompt_text,
-                    "created_at": datetime.now().isoformat(timespec="seconds"),
-                    "model": settings["model_name"],
-                    "options": {"temperature": settings["temperature"], "num_predict": settings["num_predict"]},
-                    "style_suffix": {"enabled": bool(settings.get("enable_suffix")), "applied": bool(applied)},
-                    "length_control": {"max_words": int(settings.get("max_words", 0)), "trimmed": bool(trimmed)},
-                    "reference": {
-                        "image": str(ref_image_path) if ref_image_path else None,
-                        "entity": ref_entity or None,
-                    },
-                    "paths": {"raw": str(raw_txt_path), "json": str(json_path), "master": str(master_file)},
-                }
-
-
-                # Write the JSON file and stick on the master JSONL
-                try:
-                    save_json(json_path, record)
-                    append_jsonl(master_file, record)
-                except Exception as e:
-                    st.error(f"Failed to save outputs: {e}")
-                    st.stop()
+    # Records waiting to be appended to the master JSONL, flushed once per scene
+    pending_jsonl = st.session_state.setdefault("_pending_jsonl", [])
 
-                # Confidence check
-                st.success("Prompt generated and saved.")
-                show_generated_output(prompt_text, scene_idx, shot_idx)
+    # Generate every described shot in one go
+    if st.button("Generate all shots", help="Generates every shot with a description. Existing prompts are only replaced if overwriting is enabled."):
+        _generate_all_shots(settings, master_file, pending_jsonl)
 
-        st.divider()
+    # Makes/finds folders for scenes and prompts
+    for scene_idx in range(1, int(scenes_count) + 1):
+        _render_scene(scene_idx, settings, master_file)
 
     # If JSONL was created successfully, option to download it
     if master_file.exists():
         try:
-            master_text = master_file.read_text(encoding="utf-8")
+            master_bytes, _records = _master_contents(master_file)
             st.download_button(
                 label="Download master prompts (JSONL)",
-                data=master_text,
+                data=master_bytes,
                 file_name=master_file.name,
                 mime="application/jsonl",
             )
@@ -208,40 +351,32 @@ def main() -> None:
             dedupe = st.checkbox("Remove duplicate prompts", value=True)
             if st.button("Download Prompts.txt"):
                 try:
-                    lines = []
-                    with master_file.open("r", encoding="utf-8") as f:
-                        for ln, raw in enumerate(f, 1):
-                            raw = raw.strip()
-                            if not raw:
-                                continue
-                            try:
-                                obj = json.loads(raw)
-                            except Exception:
-                                continue
-                            text = obj.get("generated_prompt", "")
-                            if not text:
-                                continue
-                            # Re-apply suffix and length constraints to be safe
-                            if settings.get("enable_suffix"):
-                                text, _ = ensure_suffix(text, settings.get("suffix_text", ""))
-                                if settings.get("max_words"):
-                                    text, _ = enforce_word_budget(text, int(settings.get("max_words", 0)), protect_suffix=settings.get("suffix_text", ""))
-                            else:
-                                if settings.get("max_words"):
-                                    text, _ = enforce_word_budget(text, int(settings.get("max_words", 0)))
-                            scene = obj.get("scene")
-                            shot = obj.get("shot")
-                            lines.append((ln, scene, shot, text))
-
+                    entries = []
+                    for ln, obj in _master_contents(master_file)[1]:
+                        text = obj.get("generated_prompt", "")
+                        if not text:
+                            continue
+                        entries.append((ln, (obj.get("scene"), obj.get("shot")), text))
+
+                    # Drop superseded prompts first (last one per scene/shot wins), so only survivors get formatted
                     if dedupe:
                         last = {}
-                        for ln, sc, ac, txt in lines:
-                            key = (sc, ac)
-                            last[key] = (ln, txt)
-                        ordered = [txt for (_k, (ln, txt)) in sorted(last.items(), key=lambda x: x[1][0])]
-                        out_text = "\n".join(ordered) + ("\n" if ordered else "")
-                    else:
-                        out_text = "\n".join(txt for (_ln, _sc, _ac, txt) in lines) + ("\n" if lines else "")
+                        for ln, key, text in entries:
+                            last[key] = (ln, key, text)
+                        entries = sorted(last.values(), key=lambda e: e[0])
+
+                    out_lines = []
+                    for _ln, _key, text in entries:
+                        # Re-apply suffix and length constraints to be safe
+                        if settings.get("enable_suffix"):
+                            text, _ = ensure_suffix(text, settings.get("suffix_text", ""))
+                            if settings.get("max_words"):
+                                text, _ = enforce_word_budget(text, int(settings.get("max_words", 0)), protect_suffix=settings.get("suffix_text", ""))
+                        else:
+                            if settings.get("max_words"):
+                                text, _ = enforce_word_budget(text, int(settings.get("max_words", 0)))
+                        out_lines.append(text)
+                    out_text = "\n".join(out_lines) + ("\n" if out_lines else "")
 
                     st.download_button(
                         label="Download prompts.txt (one per line)",
@@ -254,8 +389,13 @@ def main() -> None:
 
     # Option for ZIP export for Scenes/ and Prompts/
             if st.button("Download ZIP of Scenes and Prompts"):
-                data = create_export_zip(ROOT_SCENES, ROOT_PROMPTS)
-                st.download_button(label="Download export.zip", data=data, file_name="export.zip", mime="application/zip")
+                # One temp dir per session, so each export overwrites the last instead of piling up in /tmp
+                export_dir = st.session_state.get("_export_dir")
+                if not export_dir or not Path(export_dir).is_dir():
+                    export_dir = st.session_state["_export_dir"] = tempfile.mkdtemp(prefix="export_")
+                zip_path = create_export_zip(ROOT_SCENES, ROOT_PROMPTS, out_path=Path(export_dir) / "export.zip")
+                with zip_path.open("rb") as fh:
+                    st.download_button(label="Download export.zip", data=fh, file_name="export.zip", mime="application/zip")
 
     
     # Funtion to bacth run the promts in  ComfyUI
@@ -281,8 +421,13 @@ def main() -> None:
         prefix = st.text_input("Filename prefix", value=default_prefix)
         title_filter = st.text_input("CLIP node title filter", value="Positive Prompt")
 
-        # Option to either send prompts one by one (to test) or send them all at once
-        wait_done = st.checkbox("Wait for each job to complete", value=True)
+        # Every prompt is queued in ComfyUI up front; waiting only follows the jobs through to completion.
+        # Stopping this run does not cancel jobs already in ComfyUI's queue.
+        wait_done = st.checkbox(
+            "Track jobs until they finish", value=True,
+            help="All prompts are queued in ComfyUI at once. When ticked, this run reports each job as it completes. "
+                 "Stopping the app does not remove queued jobs; clear them from ComfyUI's queue instead."
+        )
         add_cli_suffix = st.checkbox("Add/override style suffix at batch time", value=False)
         cli_suffix = st.text_area("Batch-time suffix (optional)", value="", disabled=not add_cli_suffix)
         max_words_cli = st.number_input("Max words at batch time (0 = no trim)", min_value=0, max_value=200, value=0, step=5)
@@ -352,6 +497,9 @@ def main() -> None:
                 except Exception as e:
                     st.warning(f"Could not add parameter overrides: {e}")
 
+                # Free the prompt models' VRAM for the video model before ComfyUI starts rendering
+                unload_models(sorted({settings["model_name"], settings["text_only_model"]}))
+
                 # spinner
                 start_ts = time.time()
                 with st.spinner("Generating videos…"):
@@ -460,19 +608,11 @@ def main() -> None:
             if master_file.exists():
                 try:
                     last = {}
-                    with master_file.open("r", encoding="utf-8") as f:
-                        for ln, raw in enumerate(f, 1):
-                            raw = raw.strip()
-                            if not raw:
-                                continue
-                            try:
-                                obj = json.loads(raw)
-                            except Exception:
-                                continue
-                            sc = obj.get("scene")
-                            ac = obj.get("shot")
-                            if sc is not None and ac is not None:
-                                last[(sc, ac)] = ln
+                    for ln, obj in _master_contents(master_file)[1]:
+                        sc = obj.get("scene")
+                        ac = obj.get("shot")
+                        if sc is not None and ac is not None:
+                            last[(sc, ac)] = ln
                     show_n = max(1, len(last))
                 except Exception:
                     show_n = 20
@@ -483,9 +623,7 @@ def main() -> None:
             if not base.exists():
                 st.warning(f"Folder does not exist: {base}")
             else:
-                files = [p for p in base.rglob("*.mp4") if p.is_file()] # Only mp4s, no pngs
-                if show_prefix:
-                    files = [p for p in files if p.name.startswith(show_prefix)]
+                files = list_videos(base, prefix=show_prefix) # Only mp4s, no pngs
                 files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
                 files = files[:show_n]
 
@@ -505,8 +643,9 @@ def main() -> None:
                         except Exception:
                             pass
                         try:
-                            data_bytes = f.read_bytes()
-                            st.download_button("Download", data=data_bytes, file_name=f.name, key=str(f))
+                            # Hand Streamlit the file handle rather than holding our own bytes copy
+                            with f.open("rb") as fh:
+                                st.download_button("Download", data=fh, file_name=f.name, mime="video/mp4", key=str(f))
                         except Exception as e:
                             st.warning(f"Can't read file for download: {e}")
         except Exception as e:
@@ -527,11 +666,16 @@ def main() -> None:
         target_fps = st.number_input("Target FPS", min_value=1, max_value=120, value=24, step=1)
         crf = st.number_input("Video quality (CRF, lower=better)", min_value=12, max_value=30, value=18, step=1)
 
+        # GPU encoding is much faster than libx264; ffmpeg is only probed once per process
+        hw_encoder = best_hw_encoder()
+        use_gpu = st.checkbox(f"Use GPU encoder ({hw_encoder or 'none detected'})", value=hw_encoder is not None, disabled=hw_encoder is None)
+        encoder = hw_encoder if (use_gpu and hw_encoder) else "libx264"
+
         go = st.button("Build stitched video")
 
         if go:
             # ffmpeg available?
-            if not shutil.which("ffmpeg"):
+            if not ffmpeg_caps()["ok"]:
                 st.error("FFmpeg not found on PATH. Install FFmpeg and restart the app.")
                 st.stop()
 
@@ -541,9 +685,7 @@ def main() -> None:
                 st.stop()
 
             # Collect mp4s
-            files = [p for p in base.rglob("*.mp4") if p.is_file()]
-            if prefix_filter:
-                files = [p for p in files if p.name.startswith(prefix_filter)]
+            files = list_videos(base, prefix=prefix_filter)
             if not files:
                 st.warning("No MP4 files found matching your filter.")
                 st.stop()
@@ -573,46 +715,49 @@ def main() -> None:
             tmp_clips = []
             log = []
 
-            # Re-encode all clips
-            start_ts = time.time()
-            with st.spinner("Re-encoding clips…"):
-                prog = st.progress(0, text="Starting…")
-                log_box = st.empty()
-                lines = []
-
-                tmp_clips = []
-                for i, src in enumerate(files, 1):
-                    dst = tmp_dir / f"clip_{i:04d}.mp4"
-                    cmd = [
-                        "ffmpeg", "-y",
-                        "-i", str(src),
-                        "-r", str(int(target_fps)),
-                        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2,setsar=1",
-                        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(int(crf)),
-                        "-pix_fmt", "yuv420p",
-                        "-c:a", "aac", "-b:a", "192k",
-                        str(dst)
-                    ]
-                    try:
-                        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-                        out = proc.stdout or ""
-                        lines.append(out[-2000:])
-                        log_box.code("\n".join(lines[-5:]), language="bash")
-                        if proc.returncode != 0:
-                            st.error(f"FFmpeg failed on {src.name}")
-                            st.stop()
-                        tmp_clips.append(dst)
-                        prog.progress(i / len(files), text=f"Re-encoding clip {i}/{len(files)}…")
-                    except Exception as e:
-                        st.error(f"Failed on {src.name}: {e}")
+            # Clips from one workflow usually share codec, size and frame rate already;
+            # then the re-encode pass is skipped and the originals are stream-copied
+            if clips_share_params(files, target_fps):
+                tmp_clips = list(files)
+                st.info("All clips already share codec, size and frame rate, so they are joined without re-encoding.")
+            else:
+                # Re-encode all clips, a few at a time since each ffmpeg mostly waits on one core or the GPU
+                start_ts = time.time()
+                with st.spinner("Re-encoding clips…"):
+                    prog = st.progress(0, text="Starting…")
+                    log_box = st.empty()
+                    lines = []
+
+                    tmp_clips = [tmp_dir / f"clip_{i:04d}.mp4" for i in range(1, len(files) + 1)]
+                    cmds = [reencode_cmd(src, dst, target_fps, encoder, crf) for src, dst in zip(files, tmp_clips)]
+                    failed = None
+                    # Consumer NVIDIA drivers cap concurrent NVENC sessions, so keep GPU encodes to two at a time
+                    workers = 2 if encoder == "h264_nvenc" else 4
+                    with ThreadPoolExecutor(max_workers=min(workers, os.cpu_count() or 1)) as ex:
+                        futures = {ex.submit(subprocess.run, cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True): src
+                                   for cmd, src in zip(cmds, files)}
+                        for done, fut in enumerate(as_completed(futures), 1):
+                            src = futures[fut]
+                            try:
+                                proc = fut.result()
+                            except Exception as e:
+                                failed = failed or f"Failed on {src.name}: {e}"
+                                continue
+                            lines.append((proc.stdout or "")[-2000:])
+                            log_box.code("\n".join(lines[-5:]), language="bash")
+                            if proc.returncode != 0:
+                                failed = failed or f"FFmpeg failed on {src.name}"
+                            prog.progress(done / len(files), text=f"Re-encoded {done}/{len(files)} clips…")
+                    if failed:
+                        st.error(failed)
                         st.code("\n".join(lines[-5:]), language="bash")
                         st.stop()
 
-            st.success("Re-encode complete ✓")
+                st.success("Re-encode complete ✓")
 
             # Concat
             concat_txt = tmp_dir / "concat.txt"
-            concat_txt.write_text("".join([f"file '{c.as_posix()}'\n" for c in tmp_clips]), encoding="utf-8")
+            concat_txt.write_text("".join(concat_list_line(c) for c in tmp_clips), encoding="utf-8")
             stitched_path = tmp_dir / "_stitched.mp4"
 
             with st.spinner("Concatenating clips…"):
@@ -626,16 +771,10 @@ def main() -> None:
                 proc = subprocess.run(cmd_concat, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
                 log.append((proc.stdout or "")[-2000:])
                 if proc.returncode != 0:
-                    # Fallback: re-encode while concatenating
-                    cmd_concat2 = [
-                        "ffmpeg", "-y",
-                        "-f", "concat", "-safe", "0",
-                        "-i", str(concat_txt),
-                        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(int(crf)),
-                        "-pix_fmt", "yuv420p",
-                        "-c:a", "aac", "-b:a", "192k",
-                        str(stitched_path)
-                    ]
+                    # Fallback: join with the concat filter in a single encode pass.
+                    # Clip audio is only kept when every clip has it and no soundtrack replaces it.
+                    with_audio = audio_file is None and all(has_audio_stream(c) for c in tmp_clips)
+                    cmd_concat2 = concat_filter_cmd(tmp_clips, stitched_path, encoder, crf, with_audio=with_audio, fps=target_fps)
                     proc2 = subprocess.run(cmd_concat2, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
                     log.append((proc2.stdout or "")[-2000:])
                     if proc2.returncode != 0:
@@ -677,7 +816,8 @@ def main() -> None:
             except Exception:
                 pass
             try:
-                st.download_button("Download final MP4", data=final_path.read_bytes(), file_name=final_path.name)
+                with final_path.open("rb") as fh:
+                    st.download_button("Download final MP4", data=fh, file_name=final_path.name, mime="video/mp4")
             except Exception as e:
                 st.warning(f"Could not attach download button: {e}")
 
@@ -1,17 +1,27 @@
-import io, zipfile
+import zipfile
 from pathlib import Path
 
+# Already-compressed formats gain nothing from DEFLATE, so they are stored as-is
+STORED_SUFFIXES = {".mp4", ".mp3", ".jpg", ".jpeg", ".png", ".webp", ".parquet", ".zip", ".webm", ".mov"}
 
-def create_export_zip(*paths: Path) -> bytes:
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+
+def _compress_type(p: Path) -> int:
+    return zipfile.ZIP_STORED if p.suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+def create_export_zip(*paths: Path, out_path: Path) -> Path:
+    # Built on disk rather than in a BytesIO. Streamlit 1.45 still reads the finished file into
+    # memory when it is handed to st.download_button, so this saves the extra in-memory copy only.
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    # Level 1 DEFLATE: the text and JSON here still shrink well, at a fraction of the CPU of the default level
+    with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=1) as zf:
         for base in paths:
             base = Path(base)
             if base.is_file():
-                zf.write(base, arcname=base.name)
+                zf.write(base, arcname=base.name, compress_type=_compress_type(base))
             else:
                 for p in base.rglob("*"):
                     if p.is_file():
-                        zf.write(p, arcname=base.name / p.relative_to(base))
-    buf.seek(0)
-    return buf.read()
+                        zf.write(p, arcname=base.name / p.relative_to(base), compress_type=_compress_type(p))
+    return out_path
@@ -1,30 +1,50 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import streamlit as st
 from text_utils import enforce_word_budget
 
 
-def generate_prompt(model: str, system_msg: str, shot_desc: str, *, temperature: float, num_predict: int) -> str:
+# How long Ollama keeps the model (and its prompt cache) loaded between calls, unless the
+# caller passes its own. Matches Ollama's default so idle models free VRAM for ComfyUI.
+_KEEP_ALIVE = "5m"
+
+# Context window sent on every request. Ollama reloads a model whenever num_ctx changes, so it
+# is fixed, sized for a full batch of shots (see _BATCH_SIZE), and used by single calls too.
+_NUM_CTX = 8192
+
+# Fixed instructions live at the end of the system message, so every request shares
+# the same leading tokens and Ollama can reuse their cached prefill.
+_PROMPT_CONSTRAINTS = (
+    "For each shot description you receive, write one prompt for a text-to-video model.\n\n"
+    "Constraints:\n"
+    "- Output exactly one sentence (max ~80 words).\n"
+    "- Only describe the visuals wanted, clearly and with no fluff.\n"
+    "- Include 1 adjective, a clear action, and specific environment cues.\n"
+    "- Prefer concrete nouns over abstractions.\n"
+    "- No scene numbers, bullet points, or quotes."
+)
+
+
+def _prompt_messages(system_msg: str, shot_desc: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": f"{system_msg.strip()}\n\n{_PROMPT_CONSTRAINTS}"},
+        {"role": "user", "content": f"Shot description: \"{shot_desc.strip()}\""},
+    ]
+
+
+def generate_prompt(model: str, system_msg: str, shot_desc: str, *, temperature: float, num_predict: int, keep_alive: str = _KEEP_ALIVE) -> str:
     try:
         import ollama
     except Exception as e:
         raise RuntimeError("Unable to import 'ollama'. Ensure Ollama is installed and the Python package is available.") from e
 
-    messages = [
-        {"role": "system", "content": system_msg.strip()},
-        {"role": "user", "content": (
-            "Based on the following shot description, write one prompt for a text-to-video model.\n\n"
-            f"Shot description: \"{shot_desc.strip()}\"\n\n"
-            "Constraints:\n"
-            "- Output exactly one sentence (max ~80 words).\n"
-            "- Only describe the visuals wanted, clearly and with no fluff.\n"
-            "- Include 1 adjective, a clear action, and specific environment cues.\n"
-            "- Prefer concrete nouns over abstractions.\n"
-            "- No scene numbers, bullet points, or quotes."
-        )},
-    ]
     try:
         resp = ollama.chat(
             model=model,
-            messages=messages,
-            options={"temperature": float(temperature), "num_predict": int(num_predict)}
+            messages=_prompt_messages(system_msg, shot_desc),
+            options={"temperature": float(temperature), "num_predict": int(num_predict), "num_ctx": _NUM_CTX},
+            keep_alive=keep_alive,
         )
     except Exception as e:
         raise RuntimeError("Failed to contact Ollama. Is the Ollama server running and is the model pulled?") from e
@@ -38,6 +58,103 @@ def generate_prompt(model: str, system_msg: str, shot_desc: str, *, temperature:
     return content
 
 
+@st.cache_data(show_spinner=False, persist="disk")
+def generate_prompts_batch(model: str, system_msg: str, shot_descs: Tuple[str, ...], *, temperature: float, num_predict: int,
+                           _keep_alive: str = _KEEP_ALIVE) -> List[str]:
+    """
+    Writes prompts for several text-only shots in one Ollama call, using JSON output mode.
+    Returns one prompt per description, in order; raises RuntimeError if the reply can't be matched up.
+    `_keep_alive` is left out of the cache key (leading underscore).
+    """
+    try:
+        import ollama
+    except Exception as e:
+        raise RuntimeError("Unable to import 'ollama'. Ensure Ollama is installed and the Python package is available.") from e
+
+    system = (
+        f"{system_msg.strip()}\n\n{_PROMPT_CONSTRAINTS}\n\n"
+        'You will receive a JSON array of shots, each {"shot": n, "description": "..."}. Reply with JSON only, '
+        'in the form {"prompts": [{"shot": 1, "prompt": "..."}, ...]}, with one entry per shot.'
+    )
+    # Sent as JSON so newlines or "2: ..." inside a description can't shift the numbering
+    user = json.dumps(
+        [{"shot": i, "description": " ".join(desc.split())} for i, desc in enumerate(shot_descs, 1)],
+        ensure_ascii=False,
+    )
+    # Every shot's output budget, capped to what the fixed context leaves after the request
+    # (about 3 characters per token)
+    num_predict_total = min(int(num_predict) * len(shot_descs), _NUM_CTX - (len(system) + len(user)) // 3)
+
+    try:
+        resp = ollama.chat(
+            model=model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            options={"temperature": float(temperature), "num_predict": num_predict_total, "num_ctx": _NUM_CTX},
+            format="json",
+            keep_alive=_keep_alive,
+        )
+        entries = json.loads(resp["message"]["content"])["prompts"]
+        by_shot = {int(e["shot"]): str(e["prompt"]).strip() for e in entries}
+    except Exception as e:
+        raise RuntimeError("Batched prompt reply from Ollama could not be parsed.") from e
+
+    prompts = [by_shot.get(i, "") for i in range(1, len(shot_descs) + 1)]
+    if not all(prompts):
+        raise RuntimeError("Batched prompt reply from Ollama is missing shots.")
+    return prompts
+
+
+def stream_prompt(model: str, system_msg: str, shot_desc: str, *, temperature: float, num_predict: int, keep_alive: str = _KEEP_ALIVE) -> Iterator[str]:
+    """
+    Same request as generate_prompt, but yields the text as Ollama produces it (for st.write_stream).
+    """
+    try:
+        import ollama
+    except Exception as e:
+        raise RuntimeError("Unable to import 'ollama'. Ensure Ollama is installed and the Python package is available.") from e
+
+    try:
+        chunks = ollama.chat(
+            model=model,
+            messages=_prompt_messages(system_msg, shot_desc),
+            options={"temperature": float(temperature), "num_predict": int(num_predict), "num_ctx": _NUM_CTX},
+            keep_alive=keep_alive,
+            stream=True,
+        )
+        for chunk in chunks:
+            yield chunk["message"]["content"]
+    except Exception as e:
+        raise RuntimeError("Failed to contact Ollama. Is the Ollama server running and is the model pulled?") from e
+
+
+def warm_up_model(model: str, *, keep_alive: str = _KEEP_ALIVE) -> None:
+    """
+    Loads the model into Ollama ahead of the first Generate so it doesn't pay the cold load.
+    Best effort: failures are ignored and surface on the real call instead.
+    """
+    try:
+        import ollama
+        ollama.generate(model=model, prompt="", keep_alive=keep_alive, options={"num_ctx": _NUM_CTX})
+    except Exception:
+        pass
+
+
+def unload_models(models: List[str]) -> None:
+    """
+    Asks Ollama to drop the models from memory now (keep_alive=0), freeing VRAM for ComfyUI.
+    Best effort, like warm_up_model.
+    """
+    try:
+        import ollama
+    except Exception:
+        return
+    for model in models:
+        try:
+            ollama.generate(model=model, prompt="", keep_alive=0)
+        except Exception:
+            pass
+
+
 def _assert_vision_capable_ollama(model: str, img_path: str) -> None:
     """
     Minimal probe: call chat once with an image attached. Text-only models will error.
@@ -53,7 +170,7 @@ def _assert_vision_capable_ollama(model: str, img_path: str) -> None:
         ollama.chat(
             model=model,
             messages=[{"role": "user", "content": "Describe the image style.", "images": [img_path]}],
-            options={"num_predict": 1}
+            options={"num_predict": 1, "num_ctx": _NUM_CTX}
         )
     except Exception as e:
         msg = str(e).lower()
@@ -110,7 +227,7 @@ def generate_style_suffix_from_image(
                 {"role": "system", "content": system},
                 {"role": "user", "content": user, "images": [image_path]},
             ],
-            options={"temperature": float(temperature), "num_predict": int(num_predict)}
+            options={"temperature": float(temperature), "num_predict": int(num_predict), "num_ctx": _NUM_CTX}
         )
     except Exception as e:
         raise RuntimeError(f"Ollama call failed while analyzing the image: {e}") from e
@@ -134,7 +251,8 @@ def generate_prompt_from_desc_and_image(
     temperature: float,
     num_predict: int,
     max_words: int = 80,
-    entity_hint: str = ""
+    entity_hint: str = "",
+    keep_alive: str = _KEEP_ALIVE
 ) -> str:
     """
     Uses a vision LLM to read a reference image and the user shot description,
@@ -154,20 +272,18 @@ def generate_prompt_from_desc_and_image(
     entity_hint = (entity_hint or "").strip()
     hint_line = f"\nThe image represents: {entity_hint}." if entity_hint else ""
 
+    # Static instructions first so the prefix is identical across shots; only the user turn varies
     system = (
         (system_msg or "").strip() + "\n\n"
         "CRITICAL: Output exactly one sentence (no lists), British English, focused ONLY on visible content. "
-        "Integrate key visual details inferred from the attached image to disambiguate domain objects."
-    )
-
-    user = (
-        "Task: Write a single-sentence text-to-video prompt for the following shot.\n\n"
-        f"Shot description: \"{(shot_desc or '').strip()}\"\n"
-        f"{hint_line}\n"
+        "Integrate key visual details inferred from the attached image to disambiguate domain objects.\n\n"
+        "Task: Write a single-sentence text-to-video prompt for each shot you receive. "
         "Use the attached image to infer precise look/shape/material/texture/colour of the object(s). "
         "Be concrete and visual (camera angle, motion, setting). Avoid exposition and meta-instructions."
     )
 
+    user = f"Shot description: \"{(shot_desc or '').strip()}\"{hint_line}"
+
     try:
         resp = ollama.chat(
             model=model,
@@ -175,7 +291,8 @@ def generate_prompt_from_desc_and_image(
                 {"role": "system", "content": system},
                 {"role": "user", "content": user, "images": [image_path]},
             ],
-            options={"temperature": float(temperature), "num_predict": int(num_predict)}
+            options={"temperature": float(temperature), "num_predict": int(num_predict), "num_ctx": _NUM_CTX},
+            keep_alive=keep_alive,
         )
     except Exception as e:
         raise RuntimeError("Failed to contact Ollama for image+text prompting.") from e
@@ -190,4 +307,109 @@ def generate_prompt_from_desc_and_image(
 
     content = re.sub(r"\s+", " ", content).strip()
     content, _ = enforce_word_budget(content, int(max_words), protect_suffix=None)
-    return content
\ No newline at end of file
+    return content
+
+
+@st.cache_data(show_spinner=False, persist="disk")
+def generate_prompt_cached(
+    model: str,
+    system_msg: str,
+    shot_desc: str,
+    *,
+    temperature: float,
+    num_predict: int,
+    max_words: int = 80,
+    image_path: Optional[str] = None,
+    image_hash: Optional[str] = None,
+    entity_hint: str = "",
+    _keep_alive: str = _KEEP_ALIVE
+) -> str:
+    """
+    Memoised entry point for prompt generation, keyed on every input except `_keep_alive`.
+    Routes to the vision flow when `image_path` is given, else text-only.
+    `image_hash` keys the cache on the image content, since the saved path is reused per shot.
+    """
+    if image_path:
+        return generate_prompt_from_desc_and_image(
+            model=model,
+            system_msg=system_msg,
+            shot_desc=shot_desc,
+            image_path=image_path,
+            temperature=temperature,
+            num_predict=num_predict,
+            max_words=max_words,
+            entity_hint=entity_hint,
+            keep_alive=_keep_alive,
+        )
+    return generate_prompt(model, system_msg, shot_desc, temperature=temperature, num_predict=num_predict, keep_alive=_keep_alive)
+
+
+# Most shots sent in one batched call; bigger batches make one long generation that is costly to lose.
+# _NUM_CTX is sized to fit a batch this big.
+_BATCH_SIZE = 8
+
+
+def generate_prompts_parallel(jobs: List[Dict[str, Any]], *, max_workers: int = 4, keep_alive: str = _KEEP_ALIVE) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Runs generate_prompt_cached for each job (its keyword arguments) on a thread pool.
+    Text-only jobs that share a model and settings go in batched calls of up to _BATCH_SIZE
+    shots, run on the same pool; any batch that fails falls back to per-job calls.
+    Returns (prompt, error) per job, in the same order as `jobs`.
+    """
+    def _run(job: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            return generate_prompt_cached(**job, _keep_alive=keep_alive), None
+        except Exception as e:
+            # Raw ollama/httpx errors (model not pulled, server down) must not sink the other shots
+            return None, str(e)
+
+    if not jobs:
+        return []
+
+    # Text-only jobs sharing a model and settings are split into batches; everything else runs per job
+    batches: List[List[int]] = []
+    singles: List[int] = []
+    groups: Dict[Tuple[Any, ...], List[int]] = {}
+    for i, job in enumerate(jobs):
+        if job.get("image_path"):
+            singles.append(i)
+        else:
+            groups.setdefault((job["model"], job["system_msg"], job["temperature"], job["num_predict"]), []).append(i)
+    for group in groups.values():
+        # A batch decodes its shots one after another, so spread each group over at least as
+        # many batches as there are workers instead of filling a few large ones
+        size = min(_BATCH_SIZE, -(-len(group) // max_workers))
+        for start in range(0, len(group), size):
+            idxs = group[start:start + size]
+            if len(idxs) > 1:
+                batches.append(idxs)
+            else:
+                singles.extend(idxs)
+
+    def _run_batch(idxs: List[int]) -> Optional[List[str]]:
+        first = jobs[idxs[0]]
+        try:
+            return generate_prompts_batch(
+                first["model"], first["system_msg"], tuple(jobs[i]["shot_desc"] for i in idxs),
+                temperature=first["temperature"], num_predict=first["num_predict"], _keep_alive=keep_alive,
+            )
+        except Exception:
+            return None
+
+    results: List[Optional[Tuple[Optional[str], Optional[str]]]] = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) + len(singles)))) as ex:
+        # Batches and single jobs share the pool; failed batches fall back to per-job calls afterwards
+        batch_futures = [(idxs, ex.submit(_run_batch, idxs)) for idxs in batches]
+        single_futures = [(i, ex.submit(_run, jobs[i])) for i in singles]
+        fallback: List[int] = []
+        for idxs, fut in batch_futures:
+            prompts = fut.result()
+            if prompts is None:
+                fallback.extend(idxs)
+                continue
+            for i, prompt in zip(idxs, prompts):
+                results[i] = (prompt, None)
+        fallback_futures = [(i, ex.submit(_run, jobs[i])) for i in fallback]
+        for i, fut in single_futures + fallback_futures:
+            results[i] = fut.result()
+    return results
@@ -1,9 +1,30 @@
-import argparse, json, time
+import argparse, json, random, time, uuid
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import requests
+import requests.adapters
 import re
 
+# This script runs on its own, possibly outside the app's environment, so orjson stays optional.
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so the except clauses cover both.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+def _loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Words as counted by the --max-words budget
+_WORD_RE = re.compile(r"[\w'-]+")
+
 # Input/Output helpers
 # Reads JSONL and checks each line is compatible
 def iter_jsonl_records(path: Path, key: str = "generated_prompt") -> List[Dict[str, Any]]:
@@ -14,7 +35,7 @@ def iter_jsonl_records(path: Path, key: str = "generated_prompt") -> List[Dict[s
             if not line:
                 continue
             try:
-                obj = json.loads(line)
+                obj = _loads(line)
             except json.JSONDecodeError:
                 raise RuntimeError(f"Line {i} in {path} is not valid JSONL.")
             if key not in obj or not str(obj[key]).strip():
@@ -34,8 +55,7 @@ def iter_jsonl_records(path: Path, key: str = "generated_prompt") -> List[Dict[s
     return records
 
 def load_workflow(path: Path) -> Dict[str, Any]:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return _loads(path.read_bytes())
 
 # Workflow helpers for API and JSON
 # Registers the workflow being an API
@@ -67,9 +87,17 @@ def find_node(workflow: Dict[str, Any], type_name: str, title_contains: Optional
             raise RuntimeError(f"No node found with type={type_name!r} and title containing {title_contains!r}.")
         return sorted(candidates, key=lambda x: x.get("id", 1_000_000))[0]
 
+# Same as find_node, but None when the workflow has no such node
+def find_node_optional(workflow: Dict[str, Any], type_name: str) -> Optional[Dict[str, Any]]:
+    try:
+        return find_node(workflow, type_name)
+    except RuntimeError:
+        return None
+
 # Sends users prompt into the CLIP text node
 def set_clip_text(workflow: Dict[str, Any], node: Dict[str, Any], text: str) -> None:
-    if is_api_prompt(workflow):
+    # API nodes carry class_type; checking the node avoids rescanning the whole workflow per job
+    if "class_type" in node:
         node.setdefault("inputs", {})["text"] = text
     else:
         w = node.get("widgets_values")
@@ -77,18 +105,14 @@ def set_clip_text(workflow: Dict[str, Any], node: Dict[str, Any], text: str) ->
             raise RuntimeError("UI CLIPTextEncode node has unexpected shape.")
         w[0] = text
 
-# Edits the output name in VHSvideoCombine node
-def set_video_prefix(workflow: Dict[str, Any], prefix: str) -> None:
-    if is_api_prompt(workflow):
-        for n in workflow.values():
-            if n.get("class_type") == "VHS_VideoCombine":
-                n.setdefault("inputs", {})["filename_prefix"] = prefix
-                return
+# Edits the output name in VHSvideoCombine node; pass `node` to skip the lookup
+def set_video_prefix(workflow: Dict[str, Any], prefix: str, node: Optional[Dict[str, Any]] = None) -> None:
+    vhs = node if node is not None else find_node_optional(workflow, "VHS_VideoCombine")
+    if vhs is None:
+        return
+    if "class_type" in vhs:
+        vhs.setdefault("inputs", {})["filename_prefix"] = prefix
     else:
-        try:
-            vhs = find_node(workflow, "VHS_VideoCombine")
-        except RuntimeError:
-            return
         w = vhs.get("widgets_values")
         if isinstance(w, dict):
             w["filename_prefix"] = prefix
@@ -126,12 +150,13 @@ def set_latent_dims(workflow: Dict[str, Any], width: Optional[int], height: Opti
         except Exception:
             pass
 
-def set_noise_seed(workflow: Dict[str, Any], seed: Optional[int]) -> None:
+def set_noise_seed(workflow: Dict[str, Any], seed: Optional[int], node: Optional[Dict[str, Any]] = None) -> None:
     if seed is None: return
-    if is_api_prompt(workflow):
+    if node is not None or is_api_prompt(workflow):
         try:
-            node = find_node(workflow, "RandomNoise")
-            node["inputs"]["noise_seed"] = int(seed) if int(seed) != 0 else int(time.time()*1000) % 2147483647
+            node = node if node is not None else find_node(workflow, "RandomNoise")
+            # Jobs are queued back to back, so a clock-based seed would repeat; draw one per job
+            node["inputs"]["noise_seed"] = int(seed) if int(seed) != 0 else random.randrange(1, 2**31 - 1)
         except Exception:
             pass
 
@@ -146,35 +171,107 @@ def set_video_params(workflow: Dict[str, Any], fps: Optional[int], fmt: Optional
             pass
 
 # ComfyUI HTTP
+# One keep-alive session for every request in the batch
+_SESSION = requests.Session()
+_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16))
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
 def queue_prompt(server: str, workflow: Dict[str, Any], client_id: str) -> str:
     url = f"{server.rstrip('/')}/prompt"
     payload = {"prompt": workflow, "client_id": client_id}
-    r = requests.post(url, json=payload, timeout=60)
+    # The workflow is the bulk of every request, so encode it ourselves rather than via requests' stdlib json
+    r = _SESSION.post(url, data=_dumps(payload), headers={"Content-Type": "application/json"}, timeout=60)
     r.raise_for_status()
-    data = r.json()
+    data = _loads(r.content)
     pid = data.get("prompt_id") or data.get("data", {}).get("prompt_id")
     if not pid:
         raise RuntimeError(f"Unexpected /prompt response: {data}")
     return pid
 
+# Returns the history entry once the job has finished, None while it is still running
+def check_history(server: str, prompt_id: str) -> Optional[Dict[str, Any]]:
+    r = _SESSION.get(f"{server.rstrip('/')}/history/{prompt_id}", timeout=30)
+    if r.status_code == 200:
+        hist = _loads(r.content)
+        if prompt_id in hist:
+            status = hist[prompt_id].get("status", {})
+            if status.get("completed") or status.get("status_str") in {"success","completed"}:
+                return hist[prompt_id]
+            if status.get("status_str") in {"error","failed"}:
+                raise RuntimeError(f"ComfyUI reported error: {status}")
+    return None
+
 # Provides update when status is completed, or there is an error
+# Polls quickly at first, backing off to poll_s, so short jobs are noticed sooner
 def wait_for_completion(server: str, prompt_id: str, poll_s: float = 2.0, timeout_s: int = 3600) -> Dict[str, Any]:
-    base = server.rstrip("/")
     start = time.time()
+    delay = min(0.25, poll_s)
     while True:
-        url = f"{base}/history/{prompt_id}"
-        r = requests.get(url, timeout=30)
-        if r.status_code == 200:
-            hist = r.json()
-            if prompt_id in hist:
-                status = hist[prompt_id].get("status", {})
-                if status.get("completed") or status.get("status_str") in {"success","completed"}:
-                    return hist[prompt_id]
-                if status.get("status_str") in {"error","failed"}:
-                    raise RuntimeError(f"ComfyUI reported error: {status}")
+        entry = check_history(server, prompt_id)
+        if entry is not None:
+            return entry
         if time.time() - start > timeout_s:
             raise TimeoutError(f"Timeout waiting for job {prompt_id}.")
-        time.sleep(poll_s)
+        time.sleep(delay)
+        delay = min(delay * 2, poll_s)
+
+# ComfyUI WebSocket
+# Opens the event socket for this client id, or None if websocket-client is missing or the connect fails
+def open_ws(server: str, client_id: str) -> Optional[Any]:
+    try:
+        import websocket
+    except Exception:
+        return None
+    url = re.sub(r"^http", "ws", server.rstrip("/")) + f"/ws?clientId={client_id}"
+    try:
+        return websocket.create_connection(url, timeout=10)
+    except Exception:
+        return None
+
+# Blocks on ComfyUI's pushed events instead of polling /history, falls back to polling if the socket drops.
+# `finished` is shared across the jobs of a batch: terminal events for other prompt ids read off the
+# socket are recorded there (prompt id -> error message, or None on success) so their waits return at once.
+def wait_for_completion_ws(ws: Any, server: str, prompt_id: str, timeout_s: int = 3600, idle_s: float = 10.0,
+                           finished: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+    import websocket
+    if finished is None:
+        finished = {}
+    start = time.time()
+    ws.settimeout(idle_s)
+    while True:
+        if prompt_id in finished:
+            error = finished.pop(prompt_id)
+            if error is not None:
+                raise RuntimeError(f"ComfyUI reported error: {error}")
+            return check_history(server, prompt_id) or {}
+        remaining = timeout_s - (time.time() - start)
+        if remaining <= 0:
+            raise TimeoutError(f"Timeout waiting for job {prompt_id}.")
+        try:
+            msg = ws.recv()
+        except websocket.WebSocketTimeoutException:
+            # Quiet for a while: make sure the completion event wasn't missed
+            entry = check_history(server, prompt_id)
+            if entry is not None:
+                return entry
+            continue
+        except (websocket.WebSocketException, OSError):
+            return wait_for_completion(server, prompt_id, timeout_s=int(remaining))
+        if not isinstance(msg, str):
+            continue  # binary preview frames
+        try:
+            event = _loads(msg)
+        except json.JSONDecodeError:
+            continue
+        data = event.get("data") or {}
+        pid = data.get("prompt_id")
+        if not pid:
+            continue
+        kind = event.get("type")
+        if kind == "execution_error":
+            finished[pid] = str(data.get("exception_message") or data)
+        elif kind == "execution_success" or (kind == "executing" and data.get("node") is None):
+            finished.setdefault(pid, None)
 
 def main():
     ap = argparse.ArgumentParser()
@@ -195,7 +292,7 @@ def main():
     ap.add_argument("--fps", type=int, default=None, help="Override VHS_VideoCombine frame_rate")
     ap.add_argument("--format", type=str, default=None, help="Override VHS_VideoCombine format (e.g., video/nvenc_h264-mp4)")
     ap.add_argument("--seed", type=int, default=None, help="Override RandomNoise noise_seed (0=random)")
-    ap.add_argument("--client-id", dest="client_id", default=None, help="(Ignored) legacy WS client id")
+    ap.add_argument("--client-id", dest="client_id", default=None, help="WebSocket client id used with --wait (default: random)")
 
     args = ap.parse_args()
 
@@ -206,9 +303,28 @@ def main():
 
     records = iter_jsonl_records(args.jsonl)
     base_workflow = load_workflow(args.workflow)
+    # One workflow for the whole batch: queue_prompt serialises it on send, so each job
+    # only rewrites its own fields in place. Batch-wide overrides are applied once here.
+    wf = base_workflow
+    clip_node = find_node(wf, "CLIPTextEncode", title_contains=args.title_filter)
+    # Nodes rewritten per job, resolved once rather than scanned for on every job
+    vhs_node = find_node_optional(wf, "VHS_VideoCombine")
+    noise_node = find_node_optional(wf, "RandomNoise") if is_api_prompt(wf) else None
+    set_scheduler_steps(wf, args.steps)
+    set_flux_guidance(wf, args.guidance)
+    set_latent_dims(wf, args.width, args.height, args.length)
+    set_video_params(wf, args.fps, args.format)
+
+    # Completion events arrive over one WebSocket for the whole batch; polling is the fallback
+    client_id = args.client_id or uuid.uuid4().hex
+    ws = open_ws(args.server, client_id) if args.wait else None
+    finished: Dict[str, Optional[str]] = {}
 
     print(f"BATCH_BEGIN total={len(records)} server={args.server}", flush=True)
 
+    # Queue every job up front so ComfyUI never idles between jobs, then wait on them in order
+    queued: List[Tuple[int, str, str]] = []
+    suffix_lower = args.suffix.lower() if args.suffix else ""
     for i, rec in enumerate(records, 1):
         prompt_text = str(rec.get("_text", "")).strip()
 
@@ -216,20 +332,16 @@ def main():
         if args.suffix:
             if not prompt_text.endswith(('.', '!', '?')):
                 prompt_text = prompt_text.rstrip() + "."
-            if args.suffix.lower() not in prompt_text.lower():
+            if suffix_lower not in prompt_text.lower():
                 prompt_text = f"{prompt_text} {args.suffix}"
         if args.max_words and args.max_words > 0:
-            words = re.findall(r"[\w'-]+", prompt_text)
+            words = _WORD_RE.findall(prompt_text)
             if len(words) > args.max_words:
                 prompt_text = " ".join(words[:args.max_words]).rstrip(".")
                 if not prompt_text.endswith(('.', '!', '?')):
                     prompt_text += "."
 
-        # copy base workflow so each batch starts from the same template
-        wf = json.loads(json.dumps(base_workflow))
-
-        # Find CLIP node and set text
-        clip_node = find_node(wf, "CLIPTextEncode", title_contains=args.title_filter)
+        # Set the CLIP text
         set_clip_text(wf, clip_node, prompt_text)
 
         # Build filename label used both for saving and UI
@@ -256,28 +368,35 @@ def main():
         else:
             per_prefix = f"{args.prefix}_{i:04d}"
 
-        # Apply filename and optional overrides
-        set_video_prefix(wf, per_prefix)
-        set_scheduler_steps(wf, args.steps)
-        set_flux_guidance(wf, args.guidance)
-        set_latent_dims(wf, args.width, args.height, args.length)
-        set_noise_seed(wf, args.seed)
-        set_video_params(wf, args.fps, args.format)
+        # Apply filename and seed (seed 0 draws a fresh random seed per job)
+        if vhs_node is not None:
+            set_video_prefix(wf, per_prefix, node=vhs_node)
+        if noise_node is not None:
+            set_noise_seed(wf, args.seed, node=noise_node)
 
-        print(f"JOB_BEGIN i={i} of={len(records)} label={per_prefix}", flush=True)
+        if not args.wait:
+            print(f"JOB_BEGIN i={i} of={len(records)} label={per_prefix}", flush=True)
 
         # Queue the job
-        pid = queue_prompt(args.server, wf, "batch")
+        pid = queue_prompt(args.server, wf, client_id)
         print(f"JOB_QUEUED i={i} prompt_id={pid}", flush=True)
+        queued.append((i, per_prefix, pid))
 
-        if args.wait:
+    if args.wait:
+        for i, per_prefix, pid in queued:
+            print(f"JOB_BEGIN i={i} of={len(records)} label={per_prefix}", flush=True)
             try:
-                _ = wait_for_completion(args.server, pid)
+                if ws is not None:
+                    _ = wait_for_completion_ws(ws, args.server, pid, finished=finished)
+                else:
+                    _ = wait_for_completion(args.server, pid)
                 print(f"JOB_DONE i={i}", flush=True)
             except Exception as e:
                 msg = (str(e) or "").replace("\n", " ").strip()
                 print(f'JOB_ERROR i={i} error="{msg}"', flush=True)
 
+    if ws is not None:
+        ws.close()
     print("BATCH_END", flush=True)
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
-import json
 from pathlib import Path
-from typing import Tuple, Optional, Dict, Any
+from typing import Tuple, Optional, Dict, Any, List
+import orjson
 import streamlit as st
 from config import ROOT_SCENES, ROOT_PROMPTS
 
@@ -14,19 +14,20 @@ def ensure_scene_dirs(scene_idx: int) -> Tuple[Path, Path]:
 
 def save_json(path: Path, obj: Dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
-def append_jsonl(path: Path, obj: Dict[str, Any]) -> None:
+def append_jsonl_many(path: Path, records: List[Dict[str, Any]]) -> None:
+    # One open and one write for the whole batch instead of one per record
+    if not records:
+        return
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    with path.open("ab", buffering=64 * 1024) as f:
+        f.write(b"\n".join(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS) for obj in records) + b"\n")
 
 def load_json(path: Path) -> Optional[Dict[str, Any]]:
     if path.exists():
         try:
-            with path.open("r", encoding="utf-8") as f:
-                return json.load(f)
+            return orjson.loads(path.read_bytes())
         except Exception:
             return None
     return None
@@ -1,7 +1,11 @@
 import re
 
+# Compiled once at import rather than looked up in re's cache on every call
+_WS_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[\w'-]+")
+
 def normalise(s: str) -> str:
-    return re.sub(r"\s+", " ", s or "").strip()
+    return _WS_RE.sub(" ", s or "").strip()
 
 def ensure_suffix(prompt: str, suffix: str) -> tuple[str, bool]:
     p = (prompt or "").strip()
@@ -22,16 +26,16 @@ def enforce_word_budget(text: str, max_words: int, protect_suffix: str | None =
     if mw <= 0:
         return (text or "").strip(), False
     text = (text or "").strip()
-    words = re.findall(r"[\w'-]+", text)
+    words = _WORD_RE.findall(text)
     if len(words) <= mw:
         return text, False
     if protect_suffix:
         norm_tail = normalise(protect_suffix).lower()
         norm_text = normalise(text).lower()
         if norm_text.endswith(norm_tail):
-            tail_words = re.findall(r"[\w'-]+", protect_suffix)
+            tail_words = _WORD_RE.findall(protect_suffix)
             head_budget = max(1, mw - len(tail_words))
-            head_words = re.findall(r"[\w'-]+", text)[:head_budget]
+            head_words = words[:head_budget]
             head = " ".join(head_words).rstrip(".")
             if not head.endswith(('.', '!', '?')):
                 head = head + "."
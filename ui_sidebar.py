@@ -1,10 +1,11 @@
 from typing import Dict
 from pathlib import Path
 import os
+import shutil
 import streamlit as st
 
 from config import ROOT_PROMPTS
-from prompt_service import generate_style_suffix_from_image 
+from prompt_service import generate_style_suffix_from_image, generate_prompt_cached, generate_prompts_batch
 
 def render_sidebar(default_system: str) -> Dict:
     st.header("Settings")
@@ -12,16 +13,46 @@ def render_sidebar(default_system: str) -> Dict:
     with st.expander("System prompt (advanced)", expanded=False):
         system_prompt = st.text_area("System message sent to the model:", value=default_system, height=180)
 
-    # Primary text model
+    # Primary text model, offered at different quantisation levels
+    model_presets = {
+        "llama3.2-vision 11B · Q4_K_M (fastest, ~8 GB VRAM)": "llama3.2-vision:11b-instruct-q4_K_M",
+        "llama3.2-vision 11B · Q8_0 (balanced, ~12 GB VRAM)": "llama3.2-vision:11b-instruct-q8_0",
+        "llama3.2-vision 11B · FP16 (full precision, ~22 GB VRAM)": "llama3.2-vision:11b-instruct-fp16",
+        "Custom": "",
+    }
+    model_choice = st.selectbox("Ollama model", list(model_presets.keys()), index=0)
+    st.caption("Quantised weights (Q4/Q8) roughly double generation speed and halve VRAM compared to FP16, "
+               "with negligible quality loss for short prompts. Pull the tag first with `ollama pull <tag>`.")
     model_name = st.text_input(
         "Ollama model name",
-        value="llama3.2-vision:11b",
+        value=model_presets[model_choice] or "llama3.2-vision:11b",
+        disabled=model_choice != "Custom",
         help="Local model for prompt generation (text). Using a vision-capable model lets you use the same name for image style too."
     )
 
+    # Shots without a reference image don't need the vision encoder loaded
+    text_only_model = st.text_input(
+        "Text-only model (shots without a reference image)",
+        value="llama3.2:3b",
+        help="Smaller text model used when no reference image is attached, roughly twice as fast. Leave blank to use the model above for every shot."
+    )
+
+    # Loaded models hold VRAM that ComfyUI needs for rendering, so only keep them warm as long as asked
+    keep_alive_presets = {"5 minutes (Ollama default)": "5m", "30 minutes": "30m", "60 minutes": "60m", "Unload after each call": "0s"}
+    keep_alive_choice = st.selectbox(
+        "Keep models loaded for", list(keep_alive_presets.keys()), index=0,
+        help="How long Ollama keeps the models in memory after a call. Longer keeps Generate fast but holds GPU memory that ComfyUI also needs."
+    )
+
     temperature = st.slider("Temperature", 0.0, 1.5, 0.7, 0.05)
     num_predict = st.slider("Max tokens (num_predict)", 128, 1024, 512, 64, help="Upper bound for tokens predicted by the model.")
     overwrite_ok = st.checkbox("Overwrite existing prompts when regenerating", value=False)
+    # Generated prompts are cached on disk by their inputs; clearing forces fresh LLM calls
+    if st.button("Clear prompt cache", help="Regenerate prompts from scratch instead of reusing cached results for identical inputs."):
+        generate_prompt_cached.clear()
+        generate_prompts_batch.clear()
+        st.session_state.pop("_stream_cache", None)
+        st.success("Prompt cache cleared.")
 
     st.divider()
 
@@ -77,8 +108,9 @@ def render_sidebar(default_system: str) -> Dict:
             save_dir.mkdir(parents=True, exist_ok=True)
             ext = Path(img_file.name).suffix or ".png"
             img_path = save_dir / f"style_ref{ext}"
+            img_file.seek(0)
             with open(img_path, "wb") as f:
-                f.write(img_file.getbuffer())
+                shutil.copyfileobj(img_file, f, length=1 << 20)
 
             suffix = generate_style_suffix_from_image(vision_model, str(img_path))
             st.session_state["suffix_text"] = suffix
@@ -114,6 +146,8 @@ def render_sidebar(default_system: str) -> Dict:
     return {
         "system_prompt": system_prompt,
         "model_name": model_name,
+        "text_only_model": text_only_model.strip() or model_name,
+        "keep_alive": keep_alive_presets[keep_alive_choice],
         "temperature": temperature,
         "num_predict": num_predict,
         "overwrite_ok": overwrite_ok,
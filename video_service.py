@@ -0,0 +1,181 @@
+import functools
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+# Hardware H.264 encoders in order of preference
+HW_ENCODERS = ("h264_nvenc", "h264_videotoolbox")
+
+
+# Whether a hardware encoder actually works here. Stock ffmpeg builds list h264_nvenc even
+# without an NVIDIA GPU or driver, so listing alone isn't enough: encode one real frame.
+def _encoder_works(path: str, encoder: str) -> bool:
+    try:
+        return subprocess.run(
+            [path, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=s=256x256",
+             "-frames:v", "1", "-c:v", encoder, "-f", "null", "-"],
+            capture_output=True, timeout=15
+        ).returncode == 0
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=1)
+def ffmpeg_caps() -> Dict[str, Any]:
+    # Probed once per process: whether ffmpeg exists and which hardware encoders it can use
+    path = shutil.which("ffmpeg")
+    if not path:
+        return {"ok": False}
+    try:
+        out = subprocess.run([path, "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=5).stdout
+    except Exception:
+        out = ""
+    return {"ok": True, "path": path, **{enc: enc in out and _encoder_works(path, enc) for enc in HW_ENCODERS}}
+
+
+def best_hw_encoder() -> Optional[str]:
+    caps = ffmpeg_caps()
+    return next((enc for enc in HW_ENCODERS if caps.get(enc)), None)
+
+
+def video_encoder_args(encoder: str, crf: int) -> List[str]:
+    # Maps the CRF quality setting onto each encoder's own rate control
+    if encoder == "h264_nvenc":
+        # -b:v 0 lifts NVENC's default 2 Mb/s target, so -cq acts as constant quality
+        return ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", str(int(crf)), "-b:v", "0"]
+    if encoder == "h264_videotoolbox":
+        # VideoToolbox has no constant-quality mode, so use a generous fixed bitrate
+        return ["-c:v", "h264_videotoolbox", "-b:v", "12M"]
+    return ["-c:v", "libx264", "-preset", "veryfast", "-crf", str(int(crf))]
+
+
+def has_audio_stream(path: Path) -> bool:
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return False
+    out = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", str(path)],
+        capture_output=True, text=True
+    ).stdout
+    return bool(out.strip())
+
+
+def concat_filter_cmd(clips: List[Path], out_path: Path, encoder: str, crf: int, *, with_audio: bool, fps: int) -> List[str]:
+    # Joins the clips with the concat filter in one ffmpeg pass, no list file needed.
+    # The filter needs identical size, SAR and rate on every input, so each clip is scaled and
+    # padded into the first clip's frame and set to the target fps first.
+    sig = _stream_signature(clips[0]) if clips else None
+    width, height = (sig[0][1], sig[0][2]) if sig else (None, None)
+    fit = ""
+    if isinstance(width, int) and isinstance(height, int):
+        w, h = width - width % 2, height - height % 2
+        fit = f"scale={w}:{h}:force_original_aspect_ratio=decrease:force_divisible_by=2,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,"
+    chains = []
+    pads = ""
+    for i in range(len(clips)):
+        chains.append(f"[{i}:v:0]{fit}setsar=1,fps={int(fps)}[v{i}]")
+        pads += f"[v{i}]"
+        if with_audio:
+            chains.append(f"[{i}:a:0]aresample=48000,aformat=sample_fmts=fltp:channel_layouts=stereo[a{i}]")
+            pads += f"[a{i}]"
+    graph = ";".join(chains) + f";{pads}concat=n={len(clips)}:v=1:a={int(with_audio)}[v]" + ("[a]" if with_audio else "")
+    inputs = [arg for c in clips for arg in ("-i", str(c))]
+    audio = ["-map", "[a]", "-c:a", "aac", "-b:a", "192k"] if with_audio else []
+    return ["ffmpeg", "-y", *inputs, "-filter_complex", graph, "-map", "[v]", *audio,
+            *video_encoder_args(encoder, crf), "-pix_fmt", "yuv420p", str(out_path)]
+
+
+def _stream_signature(path: Path) -> Optional[Tuple]:
+    # The parameters that must match for the concat demuxer to stream-copy cleanly
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    proc = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries",
+         "stream=codec_type,codec_name,width,height,pix_fmt,r_frame_rate,time_base,sample_rate,channels",
+         "-of", "json", str(path)],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return None
+    try:
+        streams = json.loads(proc.stdout or "{}").get("streams", [])
+    except json.JSONDecodeError:
+        return None
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        return None
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    v_sig = tuple(video.get(k) for k in ("codec_name", "width", "height", "pix_fmt", "r_frame_rate", "time_base"))
+    a_sig = tuple(audio.get(k) for k in ("codec_name", "sample_rate", "channels")) if audio else None
+    return v_sig, a_sig
+
+
+def _frame_rate(rate: str) -> Optional[float]:
+    # ffprobe reports rates as "num/den"; a bare "num" means den=1
+    num_s, _, den_s = rate.partition("/")
+    den_s = den_s or "1"
+    if not (num_s.isdigit() and den_s.isdigit()) or den_s.strip("0") == "":
+        return None
+    return int(num_s) / int(den_s)
+
+
+def clips_share_params(clips: List[Path], fps: int) -> bool:
+    """
+    True when every clip is H.264/yuv420p at the target fps with identical stream parameters,
+    so the concat demuxer can join them with -c copy and no re-encode.
+    """
+    if not clips:
+        return False
+    sigs = [_stream_signature(c) for c in clips]
+    first = sigs[0]
+    if first is None or any(sig != first for sig in sigs[1:]):
+        return False
+    (codec, width, height, pix_fmt, rate, _tb), _audio = first
+    fr = _frame_rate(rate or "")
+    return (
+        codec == "h264" and pix_fmt == "yuv420p"
+        and isinstance(width, int) and isinstance(height, int) and width % 2 == 0 and height % 2 == 0
+        and fr is not None and abs(fr - int(fps)) < 0.01
+    )
+
+
+def concat_list_line(path: Path) -> str:
+    # Entry for an ffmpeg concat list file, with single quotes escaped
+    escaped = path.resolve().as_posix().replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+def reencode_cmd(src: Path, dst: Path, fps: int, encoder: str, crf: int) -> List[str]:
+    # Normalises one clip to the shared fps, even dimensions, yuv420p and AAC audio
+    return [
+        "ffmpeg", "-y",
+        "-i", str(src),
+        "-r", str(int(fps)),
+        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2,setsar=1",
+        *video_encoder_args(encoder, crf),
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "192k",
+        str(dst)
+    ]
+
+
+def list_videos(root: Path, *, prefix: str = "", exts: FrozenSet[str] = frozenset({".mp4"})) -> List[Path]:
+    # Iterative os.scandir walk: file/dir checks come from the directory entry, not a stat per path
+    out: List[Path] = []
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in exts and entry.name.startswith(prefix):
+                    out.append(Path(entry.path))
+    return out